@@ -0,0 +1,48 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# AWS Configuration
+AWS_CONFIG = {
+    'region': os.getenv('AWS_REGION', 'us-east-1'),
+    'input_bucket': os.getenv('INPUT_BUCKET'),
+    'output_bucket': os.getenv('OUTPUT_BUCKET'),
+    'email_data_path': os.getenv('EMAIL_DATA_PATH', 'stage3/output'),
+    'processed_output_path': os.getenv('PROCESSED_OUTPUT_PATH', 'stage4/output'),
+}
+
+# Storage Configuration ('s3' in Fargate, 'local' for offline runs)
+STORAGE_CONFIG = {
+    'backend': os.getenv('STORAGE_BACKEND', 's3'),
+    'local_root': os.getenv('LOCAL_STORAGE_ROOT', './local_s3'),
+}
+
+# Hashing Configuration
+HASH_CONFIG = {
+    'salt': os.getenv('HASH_SALT'),
+    'pepper': os.getenv('HASH_PEPPER', ''),
+    'algorithm': os.getenv('HASH_ALGORITHM', 'sha256'),
+    'email_column': os.getenv('EMAIL_COLUMN', 'Email'),
+    'hash_column': os.getenv('HASH_COLUMN', 'EmailHash'),
+    'drop_raw_email': os.getenv('DROP_RAW_EMAIL', 'true').lower() == 'true',
+}
+
+# Application Configuration
+APP_CONFIG = {
+    'chunk_size': int(os.getenv('CHUNK_SIZE', 500000)),
+    'batch_size': int(os.getenv('BATCH_SIZE', 50000)),
+    'cpu_limit': float(os.getenv('CPU_LIMIT', os.cpu_count() or 1)),
+    'output_format': os.getenv('OUTPUT_FORMAT', 'parquet'),
+    'max_retries': int(os.getenv('MAX_RETRIES', 3)),
+    'memory_limit': os.getenv('MEMORY_LIMIT', '4096M'),
+    'log_level': os.getenv('LOG_LEVEL', 'INFO'),
+}
+
+# Monitoring Configuration
+MONITORING_CONFIG = {
+    'enable_metrics': True,
+    'metrics_namespace': 'SAR/Stage4',
+    'health_check_interval': 30,
+}
@@ -0,0 +1,90 @@
+import os
+import argparse
+import logging
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from config.settings import AWS_CONFIG, HASH_CONFIG, APP_CONFIG
+from process_emails import EmailProcessor, LocalStorage
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_BUCKET = 'benchmark'
+
+
+def generate_input(storage: LocalStorage, rows: int, input_format: str, seed: int = 42):
+    """Write synthetic stage3 output with messy, partly invalid emails"""
+    rng = np.random.default_rng(seed)
+    user_ids = np.arange(rows)
+    domains = np.array(['Example.com', 'mail.example.org', 'SAR.io', 'invalid'])
+    emails = (
+        ' User.' + pd.Series(user_ids).astype(str) + '@'
+        + pd.Series(domains[rng.integers(0, len(domains), rows)])
+    )
+    df = pd.DataFrame({
+        'UserId': user_ids,
+        'ItemId': rng.integers(0, 10000, rows),
+        'Score': rng.random(rows),
+        'Email': emails,
+    })
+
+    key = f"{AWS_CONFIG['email_data_path']}/part-00000.{input_format}"
+    with storage.upload_path(BENCHMARK_BUCKET, key) as path:
+        if input_format == 'parquet':
+            df.to_parquet(path, index=False)
+        else:
+            df.to_csv(path, index=False)
+
+
+def run(rows: int, workers: list, input_format: str, chunk_size: int, batch_size: int):
+    """Hash the same synthetic input once per worker count and report throughput"""
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        storage = LocalStorage(root)
+        generate_input(storage, rows, input_format)
+
+        for worker_count in workers:
+            aws_config = dict(
+                AWS_CONFIG,
+                input_bucket=BENCHMARK_BUCKET,
+                output_bucket=BENCHMARK_BUCKET,
+                processed_output_path=f"stage4/output/workers-{worker_count}",
+            )
+            hash_config = dict(HASH_CONFIG, salt=HASH_CONFIG['salt'] or 'benchmark-salt')
+            app_config = dict(
+                APP_CONFIG,
+                cpu_limit=worker_count,
+                chunk_size=chunk_size,
+                batch_size=batch_size,
+            )
+            processor = EmailProcessor(storage, aws_config, hash_config, app_config)
+            results.append(processor.process_data())
+
+    # Cores include the parent process whenever a worker pool is used
+    print(f"{'workers':>8} {'cores':>6} {'rows':>12} {'seconds':>9} {'rows/s':>12} {'rows/s/core':>12}")
+    for stats in results:
+        print(
+            f"{stats['workers']:>8} {stats['cores']:>6} {stats['rows']:>12,} {stats['seconds']:>9.2f} "
+            f"{stats['rows_per_second']:>12,.0f} {stats['rows_per_second_per_core']:>12,.0f}"
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stage 4 email hashing throughput benchmark")
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--workers', default=f"1,{os.cpu_count() or 1}",
+                        help="Comma-separated worker counts to compare")
+    parser.add_argument('--format', choices=['parquet', 'csv'], default='parquet')
+    parser.add_argument('--chunk-size', type=int, default=APP_CONFIG['chunk_size'])
+    parser.add_argument('--batch-size', type=int, default=APP_CONFIG['batch_size'])
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    workers = sorted({int(w) for w in args.workers.split(',')})
+    run(args.rows, workers, args.format, args.chunk_size, args.batch_size)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+import os
+import hashlib
+import logging
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import boto3
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from config.settings import AWS_CONFIG, STORAGE_CONFIG, HASH_CONFIG, APP_CONFIG
+
+# Initialize logging
+logging.basicConfig(
+    level=os.getenv('LOG_LEVEL', 'INFO'),
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Deliberately permissive: one '@', no whitespace, a dot in the domain
+EMAIL_PATTERN = r'[^@\s]+@[^@\s]+\.[^@\s]+'
+
+SUPPORTED_INPUT_SUFFIXES = ('.parquet', '.csv', '.csv.gz')
+
+# Per-process hashing state, set once by _init_hasher in every worker
+_HASHER = None
+_PEPPER = b''
+
+
+class LocalStorage:
+    """Local directory stand-in for S3, laid out as <root>/<bucket>/<key>"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, bucket: str, key: str) -> str:
+        return os.path.join(self.root, bucket, *key.split('/'))
+
+    def list_keys(self, bucket: str, prefix: str) -> List[str]:
+        # Match S3 semantics: the prefix is a plain string, not a directory
+        base = os.path.join(self.root, bucket)
+        directory = prefix.rsplit('/', 1)[0] if '/' in prefix else ''
+        keys = []
+        for dirpath, _, filenames in os.walk(self._path(bucket, directory)):
+            for filename in filenames:
+                relative = os.path.relpath(os.path.join(dirpath, filename), base)
+                key = relative.replace(os.sep, '/')
+                if key.startswith(prefix):
+                    keys.append(key)
+        return sorted(keys)
+
+    def delete_keys(self, bucket: str, keys: List[str]):
+        for key in keys:
+            os.remove(self._path(bucket, key))
+
+    @contextmanager
+    def local_copy(self, bucket: str, key: str) -> Iterator[str]:
+        yield self._path(bucket, key)
+
+    @contextmanager
+    def upload_path(self, bucket: str, key: str) -> Iterator[str]:
+        path = self._path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        yield path
+
+
+class S3Storage:
+    """S3 access through temporary files so chunked readers can seek"""
+
+    def __init__(self, region: str):
+        self.s3_client = boto3.client('s3', region_name=region)
+
+    def list_keys(self, bucket: str, prefix: str) -> List[str]:
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        keys = []
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            keys.extend(obj['Key'] for obj in page.get('Contents', []))
+        return sorted(keys)
+
+    def delete_keys(self, bucket: str, keys: List[str]):
+        # delete_objects accepts at most 1000 keys per request
+        for i in range(0, len(keys), 1000):
+            self.s3_client.delete_objects(
+                Bucket=bucket,
+                Delete={'Objects': [{'Key': key} for key in keys[i:i + 1000]]}
+            )
+
+    @contextmanager
+    def local_copy(self, bucket: str, key: str) -> Iterator[str]:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, os.path.basename(key))
+            self.s3_client.download_file(bucket, key, path)
+            yield path
+
+    @contextmanager
+    def upload_path(self, bucket: str, key: str) -> Iterator[str]:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, os.path.basename(key))
+            yield path
+            self.s3_client.upload_file(path, bucket, key)
+
+
+def create_storage(storage_config: Dict, region: str):
+    """Build the storage backend named in STORAGE_BACKEND"""
+    backend = storage_config['backend']
+    if backend == 'local':
+        return LocalStorage(storage_config['local_root'])
+    if backend == 's3':
+        return S3Storage(region)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+def normalize_emails(emails: pd.Series) -> pd.Series:
+    """Trim and lowercase emails; invalid or missing addresses become <NA>"""
+    normalized = emails.astype('string').str.strip().str.lower()
+    valid = normalized.str.fullmatch(EMAIL_PATTERN).fillna(False).astype(bool)
+    return normalized.where(valid)
+
+
+def _init_hasher(algorithm: str, salt: bytes, pepper: bytes):
+    """Pre-seed the salted hash so each email only pays for its own bytes"""
+    global _HASHER, _PEPPER
+    _HASHER = hashlib.new(algorithm, salt)
+    _PEPPER = pepper
+
+
+def _hash_batch(emails: List[Optional[str]]) -> List[Optional[str]]:
+    """Hash a batch of normalized emails, passing None through"""
+    hashes = []
+    for email in emails:
+        if email is None:
+            hashes.append(None)
+            continue
+        hasher = _HASHER.copy()
+        hasher.update(email.encode('utf-8'))
+        hasher.update(_PEPPER)
+        hashes.append(hasher.hexdigest())
+    return hashes
+
+
+def _process_batch(emails: pa.Array) -> pa.Array:
+    """Normalize and hash a batch of raw emails inside a worker"""
+    # Arrow arrays pickle as flat buffers rather than one object per email
+    normalized = normalize_emails(emails.to_pandas())
+    hashes = _hash_batch(normalized.to_numpy(dtype=object, na_value=None).tolist())
+    return pa.array(hashes, type=pa.string())
+
+
+class _SerialExecutor:
+    """In-process stand-in for ProcessPoolExecutor when only one core is available"""
+
+    def __init__(self, initializer, initargs):
+        initializer(*initargs)
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+    def shutdown(self, wait: bool = True):
+        pass
+
+
+class EmailProcessor:
+    def __init__(
+        self,
+        storage=None,
+        aws_config: Optional[Dict] = None,
+        hash_config: Optional[Dict] = None,
+        app_config: Optional[Dict] = None
+    ):
+        self.aws_config = aws_config or AWS_CONFIG
+        self.hash_config = hash_config or HASH_CONFIG
+        self.app_config = app_config or APP_CONFIG
+        self.storage = storage or create_storage(STORAGE_CONFIG, self.aws_config['region'])
+
+        if not self.hash_config['salt']:
+            raise ValueError("HASH_SALT must be set")
+        try:
+            # Variable-length digests (shake_*) fail here instead of inside the workers
+            hashlib.new(self.hash_config['algorithm']).hexdigest()
+        except (ValueError, TypeError):
+            raise ValueError(f"Unsupported hash algorithm: {self.hash_config['algorithm']}")
+        if self.app_config['output_format'] not in ('parquet', 'csv'):
+            raise ValueError(f"Unsupported output format: {self.app_config['output_format']}")
+        if self.app_config['max_retries'] < 1:
+            raise ValueError("MAX_RETRIES must be at least 1")
+
+        self.input_bucket = self.aws_config['input_bucket']
+        self.output_bucket = self.aws_config['output_bucket'] or self.input_bucket
+        # Trailing '/' so 'stage3/output' does not also match 'stage3/output_old'
+        self.input_prefix = self.aws_config['email_data_path'].rstrip('/') + '/'
+        self.output_prefix = self.aws_config['processed_output_path'].rstrip('/') + '/'
+        if self.output_bucket == self.input_bucket and (
+            self.input_prefix.startswith(self.output_prefix)
+            or self.output_prefix.startswith(self.input_prefix)
+        ):
+            raise ValueError("Input and output paths must not overlap")
+        self.email_column = self.hash_config['email_column']
+        self.hash_column = self.hash_config['hash_column']
+        self.chunk_size = self.app_config['chunk_size']
+        self.batch_size = self.app_config['batch_size']
+        self.max_retries = self.app_config['max_retries']
+        # Fargate CPU limits may be fractional; always keep at least one worker
+        self.workers = max(1, int(self.app_config['cpu_limit']))
+        # A pool also keeps the parent busy reading, slicing and writing
+        self.cores = self.workers + 1 if self.workers > 1 else 1
+        # One chunk being hashed while the next one is read
+        self.max_pending_chunks = 2
+        # Fixed by the first chunk of a run so every part file shares one schema
+        self.output_schema = None
+
+    def _create_executor(self):
+        initargs = (
+            self.hash_config['algorithm'],
+            self.hash_config['salt'].encode('utf-8'),
+            self.hash_config['pepper'].encode('utf-8'),
+        )
+        if self.workers == 1:
+            return _SerialExecutor(_init_hasher, initargs)
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_hasher,
+            initargs=initargs
+        )
+
+    def list_input_keys(self) -> List[str]:
+        """List stage3 output files, failing before any output is touched if there are none"""
+        keys = [
+            key for key in self.storage.list_keys(self.input_bucket, self.input_prefix)
+            if key.endswith(SUPPORTED_INPUT_SUFFIXES)
+        ]
+        if not keys:
+            raise FileNotFoundError(f"No input files under {self.input_bucket}/{self.input_prefix}")
+        return keys
+
+    def iter_chunks(self, keys: List[str]) -> Iterator[Tuple[str, pd.DataFrame, Optional[pa.Schema]]]:
+        """Stream stage3 output as DataFrames of at most chunk_size rows, with the file's Arrow schema if it has one"""
+        for key in keys:
+            logger.info(f"Reading {self.input_bucket}/{key}")
+            with self.storage.local_copy(self.input_bucket, key) as path:
+                if key.endswith('.parquet'):
+                    parquet_file = pq.ParquetFile(path)
+                    for batch in parquet_file.iter_batches(batch_size=self.chunk_size):
+                        yield key, batch.to_pandas(), parquet_file.schema_arrow
+                else:
+                    for chunk in pd.read_csv(
+                        path,
+                        chunksize=self.chunk_size,
+                        dtype={self.email_column: str}
+                    ):
+                        yield key, chunk, None
+
+    def _infer_output_schema(self, chunk: pd.DataFrame, source_schema: Optional[pa.Schema]) -> pa.Schema:
+        inferred = pa.Schema.from_pandas(chunk, preserve_index=False)
+        fields = []
+        for field in inferred:
+            if source_schema is not None and field.name in source_schema.names:
+                field = source_schema.field(field.name)
+            elif chunk[field.name].isna().all():
+                # An all-null first chunk says nothing about the column's type
+                logger.warning(
+                    f"Column '{field.name}' is entirely null in the first chunk; writing it as string. "
+                    f"Later non-text values in it will fail the run"
+                )
+                field = field.with_type(pa.string())
+            fields.append(field)
+        return pa.schema(fields)
+
+    def to_table(self, chunk: pd.DataFrame, hashes: pa.ChunkedArray, source_schema: Optional[pa.Schema] = None) -> pa.Table:
+        """Convert a processed chunk to Arrow, cast to the run's output schema, with the hashes appended"""
+        if self.output_schema is None:
+            self.output_schema = self._infer_output_schema(chunk, source_schema)
+
+        for field in self.output_schema:
+            column = chunk[field.name]
+            is_text = pa.types.is_string(field.type) or pa.types.is_large_string(field.type)
+            if not is_text or column.dtype == object or pd.api.types.is_string_dtype(column.dtype):
+                continue
+            if not column.isna().all():
+                raise ValueError(
+                    f"Column '{field.name}' is written as string but now holds {column.dtype} values; "
+                    f"increase CHUNK_SIZE or provide stage3 output as Parquet"
+                )
+            # An all-null text column read back as float NaN
+            chunk[field.name] = column.astype('string')
+
+        table = pa.Table.from_pandas(chunk, schema=self.output_schema, preserve_index=False)
+        table = table.append_column(pa.field(self.hash_column, pa.string()), hashes)
+        # Per-chunk pandas metadata would make otherwise identical part schemas differ
+        return table.replace_schema_metadata()
+
+    def remove_stale_parts(self, written_keys: List[str]):
+        """Remove part files from earlier runs that this run did not overwrite"""
+        stale_keys = [
+            key for key in self.storage.list_keys(self.output_bucket, self.output_prefix)
+            if key not in written_keys and key[len(self.output_prefix):].startswith('part-')
+        ]
+        if stale_keys:
+            logger.info(f"Removing {len(stale_keys)} stale part file(s) under {self.output_bucket}/{self.output_prefix}")
+            self.storage.delete_keys(self.output_bucket, stale_keys)
+
+    def write_chunk(self, part: int, table: pa.Table) -> str:
+        """Write one processed chunk as its own part file"""
+        output_format = self.app_config['output_format']
+        key = f"{self.output_prefix}part-{part:05d}.{output_format}"
+
+        for attempt in range(self.max_retries):
+            try:
+                with self.storage.upload_path(self.output_bucket, key) as path:
+                    if output_format == 'parquet':
+                        pq.write_table(table, path)
+                    else:
+                        pa_csv.write_csv(table, path)
+                return key
+            except Exception as e:
+                if attempt == self.max_retries - 1:
+                    raise
+                logger.warning(f"Retry {attempt + 1} writing {key}: {str(e)}")
+
+    def _finish_chunk(
+        self,
+        part: int,
+        chunk: pd.DataFrame,
+        source_schema: Optional[pa.Schema],
+        futures: List[Future]
+    ) -> Tuple[str, int]:
+        hashes = pa.chunked_array([future.result() for future in futures], type=pa.string())
+        drop_columns = [self.hash_column]
+        if self.hash_config['drop_raw_email']:
+            drop_columns.append(self.email_column)
+        chunk = chunk.drop(columns=drop_columns, errors='ignore')
+
+        table = self.to_table(chunk, hashes, source_schema)
+        key = self.write_chunk(part, table)
+        invalid = hashes.null_count
+        logger.info(f"Wrote {table.num_rows} rows ({invalid} invalid emails) to {self.output_bucket}/{key}")
+        return key, invalid
+
+    def process_data(self) -> Dict:
+        """Normalize, hash and write all emails; returns throughput statistics"""
+        start = time.perf_counter()
+        total_rows = 0
+        invalid_rows = 0
+        parts = 0
+        pending = deque()
+        written_keys = []
+        input_columns = None
+        self.output_schema = None
+
+        keys = self.list_input_keys()
+        logger.info(f"Hashing with {self.workers} worker(s), chunk size {self.chunk_size}, batch size {self.batch_size}")
+        executor = self._create_executor()
+        try:
+            for key, chunk, source_schema in self.iter_chunks(keys):
+                if self.email_column not in chunk.columns:
+                    raise KeyError(f"{key} is missing the '{self.email_column}' column")
+                if input_columns is None:
+                    input_columns = list(chunk.columns)
+                elif set(chunk.columns) != set(input_columns):
+                    raise ValueError(
+                        f"{key} has columns {list(chunk.columns)}, "
+                        f"expected {input_columns} as in the first input file"
+                    )
+
+                emails = chunk[self.email_column]
+                futures = [
+                    executor.submit(
+                        _process_batch,
+                        pa.array(emails.iloc[i:i + self.batch_size], type=pa.string(), from_pandas=True)
+                    )
+                    for i in range(0, len(emails), self.batch_size)
+                ]
+                pending.append((parts, chunk, source_schema, futures))
+                parts += 1
+                total_rows += len(chunk)
+
+                if len(pending) >= self.max_pending_chunks:
+                    written_key, invalid = self._finish_chunk(*pending.popleft())
+                    written_keys.append(written_key)
+                    invalid_rows += invalid
+
+            while pending:
+                written_key, invalid = self._finish_chunk(*pending.popleft())
+                written_keys.append(written_key)
+                invalid_rows += invalid
+        finally:
+            executor.shutdown(wait=True)
+
+        # Only once every part is written, so a failed run keeps the previous output
+        self.remove_stale_parts(written_keys)
+
+        elapsed = time.perf_counter() - start
+        rows_per_second = total_rows / elapsed if elapsed > 0 else 0.0
+        stats = {
+            'rows': total_rows,
+            'invalid_rows': invalid_rows,
+            'parts': parts,
+            'workers': self.workers,
+            'cores': self.cores,
+            'seconds': elapsed,
+            'rows_per_second': rows_per_second,
+            'rows_per_second_per_core': rows_per_second / self.cores,
+        }
+        logger.info(
+            f"Processed {total_rows} rows into {parts} part(s) in {elapsed:.2f}s "
+            f"({rows_per_second:,.0f} rows/s, {stats['rows_per_second_per_core']:,.0f} rows/s/core over {self.cores} core(s))"
+        )
+        return stats
+
+
+def main():
+    try:
+        logger.info("Starting email processing")
+        processor = EmailProcessor()
+        stats = processor.process_data()
+
+        if stats['rows'] > 0:
+            logger.info("Email processing completed successfully")
+            exit(0)
+        else:
+            logger.error("Email processing found no rows")
+            exit(1)
+
+    except Exception as e:
+        logger.error(f"Critical error in main: {str(e)}")
+        exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Mirror the container layout: PYTHONPATH=/app with scripts run from src/
+STAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [STAGE_DIR, os.path.join(STAGE_DIR, 'src')]
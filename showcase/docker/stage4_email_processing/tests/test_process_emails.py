@@ -0,0 +1,158 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from config.settings import AWS_CONFIG, HASH_CONFIG, APP_CONFIG
+from process_emails import EmailProcessor, LocalStorage, _hash_batch, _init_hasher, normalize_emails
+
+# sha256(b'test-salt' + b'user@example.com' + b'test-pepper')
+GOLDEN_DIGEST = '895aef5da22adbd3de5b8f35218e9e6f0255e891ec144ccf65763e09cc6bbfa9'
+
+
+def make_processor(root, cpu_limit=1, chunk_size=2, **hash_overrides):
+    aws_config = dict(
+        AWS_CONFIG,
+        input_bucket='bucket',
+        output_bucket='bucket',
+        email_data_path='stage3/output',
+        processed_output_path='stage4/output',
+    )
+    hash_config = dict(HASH_CONFIG, salt='test-salt', pepper='test-pepper', algorithm='sha256')
+    hash_config.update(hash_overrides)
+    app_config = dict(APP_CONFIG, cpu_limit=cpu_limit, chunk_size=chunk_size, batch_size=1, max_retries=1)
+    return EmailProcessor(LocalStorage(str(root)), aws_config, hash_config, app_config)
+
+
+def write_input(root, df, key='stage3/output/part-00000.csv'):
+    storage = LocalStorage(str(root))
+    with storage.upload_path('bucket', key) as path:
+        if key.endswith('.parquet'):
+            df.to_parquet(path, index=False)
+        else:
+            df.to_csv(path, index=False)
+
+
+def read_output(root):
+    storage = LocalStorage(str(root))
+    tables = []
+    for key in storage.list_keys('bucket', 'stage4/output/'):
+        with storage.local_copy('bucket', key) as path:
+            tables.append(pq.read_table(path))
+    return tables
+
+
+@pytest.fixture
+def interactions():
+    return pd.DataFrame({
+        'UserId': [1, 2, 3, 4],
+        'Segment': ['a', 'b', None, None],
+        'Email': [' User@Example.COM ', 'not-an-email', None, 'other@example.org'],
+    })
+
+
+def test_golden_digest():
+    _init_hasher('sha256', b'test-salt', b'test-pepper')
+    assert _hash_batch(['user@example.com', None]) == [GOLDEN_DIGEST, None]
+
+
+def test_normalize_emails():
+    emails = pd.Series([' User@Example.COM ', 'not-an-email', 'a@b', '', None])
+    normalized = normalize_emails(emails)
+    assert normalized[0] == 'user@example.com'
+    assert normalized[1:].isna().all()
+
+
+def test_serial_and_pool_output_match(tmp_path, interactions):
+    write_input(tmp_path, interactions)
+
+    make_processor(tmp_path, cpu_limit=1).process_data()
+    serial = [table.to_pylist() for table in read_output(tmp_path)]
+    make_processor(tmp_path, cpu_limit=2).process_data()
+    pooled = [table.to_pylist() for table in read_output(tmp_path)]
+
+    assert serial == pooled
+    assert serial[0][0]['EmailHash'] == GOLDEN_DIGEST
+    assert serial[0][1]['EmailHash'] is None
+    assert 'Email' not in serial[0][0]
+
+
+def test_part_files_share_schema(tmp_path, interactions):
+    write_input(tmp_path, interactions)
+    make_processor(tmp_path).process_data()
+
+    tables = read_output(tmp_path)
+    assert len(tables) == 2
+    assert tables[0].schema == tables[1].schema
+    assert pa.types.is_int64(tables[0].schema.field('UserId').type)
+    segment_type = tables[0].schema.field('Segment').type
+    assert pa.types.is_string(segment_type) or pa.types.is_large_string(segment_type)
+
+
+def test_all_null_first_chunk_stays_text(tmp_path, interactions):
+    write_input(tmp_path, interactions.iloc[::-1])
+    make_processor(tmp_path).process_data()
+
+    tables = read_output(tmp_path)
+    assert tables[0].schema == tables[1].schema
+    assert tables[1].column('Segment').to_pylist() == ['b', 'a']
+
+
+def test_rerun_removes_stale_parts(tmp_path, interactions):
+    write_input(tmp_path, interactions)
+    make_processor(tmp_path, chunk_size=1).process_data()
+    assert len(read_output(tmp_path)) == 4
+
+    make_processor(tmp_path, chunk_size=4).process_data()
+    assert len(read_output(tmp_path)) == 1
+
+
+def test_missing_input_keeps_previous_output(tmp_path, interactions):
+    write_input(tmp_path, interactions)
+    make_processor(tmp_path).process_data()
+    LocalStorage(str(tmp_path)).delete_keys('bucket', ['stage3/output/part-00000.csv'])
+
+    with pytest.raises(FileNotFoundError):
+        make_processor(tmp_path).process_data()
+    assert len(read_output(tmp_path)) == 2
+
+
+def test_mismatched_input_columns_fail_without_touching_output(tmp_path, interactions):
+    write_input(tmp_path, interactions)
+    make_processor(tmp_path, chunk_size=4).process_data()
+
+    write_input(tmp_path, interactions.assign(X=1), key='stage3/output/part-00001.csv')
+    with pytest.raises(ValueError, match='part-00001.csv'):
+        make_processor(tmp_path, chunk_size=4).process_data()
+    assert len(read_output(tmp_path)) == 1
+
+
+def test_numbers_after_all_null_first_chunk_fail(tmp_path, interactions):
+    write_input(tmp_path, interactions.assign(Score=[None, None, 0.5, 1.5]))
+
+    with pytest.raises(ValueError, match="'Score'"):
+        make_processor(tmp_path).process_data()
+
+
+def test_input_prefix_excludes_sibling_paths(tmp_path, interactions):
+    write_input(tmp_path, interactions)
+    write_input(tmp_path, interactions, key='stage3/output_old/part-00000.csv')
+
+    stats = make_processor(tmp_path).process_data()
+    assert stats['rows'] == len(interactions)
+
+
+@pytest.mark.parametrize('overrides', [
+    {'algorithm': 'shake_128'},
+    {'algorithm': 'not-a-hash'},
+])
+def test_rejects_unusable_algorithms(tmp_path, overrides):
+    with pytest.raises(ValueError):
+        make_processor(tmp_path, **overrides)
+
+
+def test_rejects_zero_retries(tmp_path):
+    processor = make_processor(tmp_path)
+    with pytest.raises(ValueError):
+        EmailProcessor(processor.storage, processor.aws_config, processor.hash_config,
+                       dict(processor.app_config, max_retries=0))